@@ -1,44 +1,159 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, session
+from flask import Flask, Response, request, jsonify, render_template, stream_template, redirect, url_for, session
+import functools
+import re
 import sqlite3
-from database import init_db, get_db_connection
+import threading
+import time
+import uuid
+from datetime import date
+from markupsafe import escape
+from database import init_db, borrow_conn, executemany_in_transaction
 import os # For generating secret key
 
 app = Flask(__name__)
 # It's important to set a secret key for session management.
-# In a real application, use a more secure and persistent key.
-app.secret_key = os.urandom(24)
+# Set APP_SECRET_KEY to keep sessions valid across restarts and workers;
+# otherwise a random key is generated for this process.
+app.secret_key = os.environ.get("APP_SECRET_KEY") or os.urandom(24)
+
+
+# --- SQL statements ---
+# Kept as constants so each pooled connection's statement cache sees the same text every call.
+# OR IGNORE: a duplicate name inserts nothing instead of raising IntegrityError
+_SQL_ADD_PARTICIPANT = "INSERT OR IGNORE INTO participants (name, email) VALUES (?, ?)"
+
+_SQL_GET_ALL_PARTICIPANTS = "SELECT id, name, email FROM participants ORDER BY name"
+
+_SQL_GET_PARTICIPANTS_PAGE = _SQL_GET_ALL_PARTICIPANTS + " LIMIT ? OFFSET ?"
+
+# Insert, or update the status if this participant already has a record for the date
+_SQL_UPSERT_ATTENDANCE = """
+    INSERT INTO attendance_records (participant_id, session_date, status)
+    VALUES (?, ?, ?)
+    ON CONFLICT (participant_id, session_date) DO UPDATE SET status = excluded.status
+"""
+
+_SQL_GET_ATTENDANCE_FOR_SESSION = """
+    SELECT p.name AS participant_name, ar.status, ar.session_date
+    FROM attendance_records ar
+    JOIN participants p ON ar.participant_id = p.id
+    WHERE ar.session_date = ?
+    ORDER BY p.name
+"""
+
+# Attendance form fields are named status_<participant id>
+_STATUS_RE = re.compile(r'^status_(\d+)$')
+
+# Participants shown per page on the setup page
+PARTICIPANTS_PAGE_SIZE = 50
+
+# Participant lists keyed by (limit, offset), stored as (rows, monotonic timestamp).
+# The roster only changes through add_participant, which invalidates this cache;
+# the TTL bounds staleness if the database is edited from elsewhere. At most
+# PARTICIPANTS_CACHE_MAX_PAGES lists are kept, oldest first out.
+PARTICIPANTS_CACHE_TTL = 60  # seconds
+PARTICIPANTS_CACHE_MAX_PAGES = 32
+_participants_cache = {'pages': {}, 'version': 0}
+_participants_cache_lock = threading.Lock()
+
+# Rosters with at least this many participants reuse a cached render of the attendance
+# form; smaller ones are cheap enough to render on every request.
+ATTENDANCE_FORM_CACHE_MIN_PARTICIPANTS = 20
+# Stands in for the session date in the cached form; random so no participant name can match it
+_SESSION_DATE_PLACEHOLDER = f"__session_date_{uuid.uuid4().hex}__"
+
+# Attendance records per ISO session date, stored as (records, monotonic timestamp).
+# Writes made through this process invalidate the affected dates; the TTLs bound
+# staleness for writes made elsewhere. Past sessions rarely change, so they are
+# kept longer than today's and future ones. At most ATTENDANCE_CACHE_MAX_ENTRIES
+# dates are kept, oldest first out.
+ATTENDANCE_CACHE_TTL = 300  # seconds
+ATTENDANCE_PAST_CACHE_TTL = 3600  # seconds
+ATTENDANCE_CACHE_MAX_ENTRIES = 256
+_attendance_cache = {}
+_attendance_cache_version = 0
+_attendance_cache_lock = threading.Lock()
+
+def _cache_put(cache, key, value, max_entries):
+    """Stores value under key, evicting the oldest entries to keep at most max_entries. Call with the cache's lock held."""
+    cache.pop(key, None)  # Re-inserting moves the key to the newest position
+    while len(cache) >= max_entries:
+        del cache[next(iter(cache))]
+    cache[key] = value
+
+def _is_iso_date(value):
+    """Returns True if value is a date in YYYY-MM-DD form."""
+    try:
+        return date.fromisoformat(value).isoformat() == value
+    except ValueError:
+        return False
+
+def _invalidate_attendance(session_dates):
+    """Drops cached attendance for the given session dates."""
+    global _attendance_cache_version
+    with _attendance_cache_lock:
+        for session_date in session_dates:
+            _attendance_cache.pop(session_date, None)
+        _attendance_cache_version += 1
+
+def clear_caches():
+    """Drops all cached query results, e.g. after the database is re-initialized."""
+    global _attendance_cache_version
+    with _participants_cache_lock:
+        _participants_cache['pages'].clear()
+        _participants_cache['version'] += 1
+    with _attendance_cache_lock:
+        _attendance_cache.clear()
+        _attendance_cache_version += 1
 
 
 @app.route('/init_db_route', methods=['POST']) # Renamed to avoid conflict if init_db is called elsewhere
 def initialize_database_route():
     init_db()
+    clear_caches()
     return jsonify({"message": "Database initialized successfully"}), 200
 
+@app.cli.command("init-db")
+def init_db_command():
+    """Create the database tables and indexes."""
+    init_db()
+    clear_caches()
+
 # --- Participant Management Functions (from previous step, assumed to be here) ---
 def add_participant(name, email=None):
-    """Adds a new participant to the participants table."""
-    try:
-        conn = get_db_connection()
+    """Adds a new participant to the participants table; returns None if the name is taken."""
+    with borrow_conn() as conn:
         cursor = conn.cursor()
-        cursor.execute("INSERT INTO participants (name, email) VALUES (?, ?)", (name, email))
-        conn.commit()
+        cursor.execute(_SQL_ADD_PARTICIPANT, (name, email))
+        if cursor.rowcount == 0:  # Name already taken
+            return None
         participant_id = cursor.lastrowid
-        conn.close()
-        return participant_id
-    except sqlite3.IntegrityError:  # Handles UNIQUE constraint violation for name
-        return None
-    except Exception as e:
-        print(f"Error adding participant: {e}")
-        return None
+    with _participants_cache_lock:
+        _participants_cache['pages'].clear()
+        _participants_cache['version'] += 1
+    return participant_id
 
-def get_all_participants():
-    """Retrieves all participants from the database."""
+def get_all_participants(limit=None, offset=0):
+    """Retrieves participants ordered by name, optionally only `limit` of them starting at `offset`."""
+    key = (limit, offset)
+    with _participants_cache_lock:
+        cached = _participants_cache['pages'].get(key)
+        if cached is not None and time.monotonic() - cached[1] < PARTICIPANTS_CACHE_TTL:
+            return cached[0]
+        version = _participants_cache['version']
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, email FROM participants ORDER BY name") # Added ORDER BY
-        participants = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        with borrow_conn() as conn:
+            cursor = conn.cursor()
+            if limit is None:
+                cursor.execute(_SQL_GET_ALL_PARTICIPANTS)
+            else:
+                cursor.execute(_SQL_GET_PARTICIPANTS_PAGE, (limit, offset))
+            participants = cursor.fetchall()
+        with _participants_cache_lock:
+            # Don't store a result that raced with an invalidation
+            if _participants_cache['version'] == version:
+                _cache_put(_participants_cache['pages'], key, (participants, time.monotonic()),
+                           PARTICIPANTS_CACHE_MAX_PAGES)
         return participants
     except Exception as e:
         print(f"Error getting all participants: {e}")
@@ -47,54 +162,51 @@ def get_all_participants():
 def record_attendance(participant_id, session_date, status):
     """Records or updates attendance for a participant on a given session date."""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        # Check if a record already exists
-        cursor.execute("""
-            SELECT id FROM attendance_records
-            WHERE participant_id = ? AND session_date = ?
-        """, (participant_id, session_date))
-        record = cursor.fetchone()
-
-        if record:
-            # Update existing record
-            cursor.execute("""
-                UPDATE attendance_records
-                SET status = ?
-                WHERE id = ?
-            """, (status, record['id']))
-        else:
-            # Insert new record
-            cursor.execute("""
-                INSERT INTO attendance_records (participant_id, session_date, status)
-                VALUES (?, ?, ?)
-            """, (participant_id, session_date, status))
-        
-        conn.commit()
-        conn.close()
+        with borrow_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute(_SQL_UPSERT_ATTENDANCE, (participant_id, session_date, status))
+        _invalidate_attendance([session_date])
         return True
-    except Exception as e:
+    except sqlite3.IntegrityError as e:  # e.g. an invalid status or unknown participant
         print(f"Error recording attendance: {e}")
         return False
 
+def batch_record_attendance(rows):
+    """Records or updates attendance for many (participant_id, session_date, status) rows in one transaction."""
+    try:
+        executemany_in_transaction(_SQL_UPSERT_ATTENDANCE, rows)
+        _invalidate_attendance({row[1] for row in rows})
+        return True
+    except sqlite3.IntegrityError as e:  # e.g. an invalid status or unknown participant
+        print(f"Error recording attendance batch: {e}")
+        return False
+
 def get_attendance_for_session(session_date):
     """Retrieves attendance records for a specific session date, including participant names."""
+    # Only real dates are cached, so arbitrary query strings can't fill the cache
+    cacheable = _is_iso_date(session_date)
+    with _attendance_cache_lock:
+        cached = _attendance_cache.get(session_date)
+        version = _attendance_cache_version
+    if cached is not None:
+        records, ts = cached
+        ttl = ATTENDANCE_PAST_CACHE_TTL if session_date < date.today().isoformat() else ATTENDANCE_CACHE_TTL
+        if time.monotonic() - ts < ttl:
+            return records
+
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT p.name AS participant_name, ar.status, ar.session_date
-            FROM attendance_records ar
-            JOIN participants p ON ar.participant_id = p.id
-            WHERE ar.session_date = ?
-            ORDER BY p.name
-        """, (session_date,)) # Added ORDER BY
-        records = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return records
+        with borrow_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute(_SQL_GET_ATTENDANCE_FOR_SESSION, (session_date,))
+            records = cursor.fetchall()
     except Exception as e:
         print(f"Error getting attendance for session {session_date}: {e}")
         return []
+    with _attendance_cache_lock:
+        # Don't store a result that raced with a write
+        if cacheable and _attendance_cache_version == version:
+            _cache_put(_attendance_cache, session_date, (records, time.monotonic()), ATTENDANCE_CACHE_MAX_ENTRIES)
+    return records
 
 # --- Flask Routes ---
 
@@ -111,8 +223,8 @@ def setup_page():
             participant_name = request.form.get('participant_name')
             if participant_name:
                 add_participant(participant_name)
-            # Stay on setup page, participants list will refresh
-            return redirect(url_for('setup_page'))
+            # Render the refreshed list directly rather than redirecting to a second GET
+            return _render_setup_page(page=0)
         
         elif action == 'proceed_to_attendance':
             if session.get('session_date'):
@@ -122,8 +234,15 @@ def setup_page():
                 # Or handle with an error message on setup.html
                 return redirect(url_for('setup_page')) 
                 
-    participants = get_all_participants()
-    return render_template('setup.html', participants=participants, session=session)
+    return _render_setup_page(page=max(request.args.get('page', 0, type=int), 0))
+
+def _render_setup_page(page):
+    """Renders the setup page showing one page of participants."""
+    # Fetch one extra row to know whether there is a next page
+    participants = get_all_participants(limit=PARTICIPANTS_PAGE_SIZE + 1, offset=page * PARTICIPANTS_PAGE_SIZE)
+    has_next_page = len(participants) > PARTICIPANTS_PAGE_SIZE
+    return render_template('setup.html', participants=participants[:PARTICIPANTS_PAGE_SIZE],
+                           session=session, page=page, has_next_page=has_next_page)
 
 @app.route('/attendance', methods=['GET', 'POST'])
 def mark_attendance_page():
@@ -137,18 +256,13 @@ def mark_attendance_page():
             # This case should ideally not happen if form is correctly submitted
             return redirect(url_for('setup_page'))
 
-        for key, value in request.form.items():
-            if key.startswith('status_'):
-                participant_id = key.split('_')[1]
-                status = value
-                # Make sure participant_id is an integer
-                try:
-                    p_id_int = int(participant_id)
-                    record_attendance(p_id_int, session_date, status)
-                except ValueError:
-                    print(f"Error: Could not convert participant_id '{participant_id}' to int.")
-                except Exception as e:
-                    print(f"Error recording attendance for participant {participant_id}: {e}")
+        rows = [(int(m.group(1)), session_date, request.form[key])
+                for key in request.form if (m := _STATUS_RE.match(key))]
+        # The batch is all-or-nothing: one bad row (unknown participant, invalid status) saves nothing
+        if rows and not batch_record_attendance(rows):
+            return render_template('mark_attendance.html', participants=get_all_participants(),
+                                   session_date=session_date,
+                                   error="Attendance could not be saved. Please check the form and try again."), 400
         
         # After processing, redirect to the view page for the recorded session date
         return redirect(url_for('view_attendance_page', session_date_view=session_date))
@@ -156,25 +270,42 @@ def mark_attendance_page():
     participants = get_all_participants()
     if not participants: # If no participants, maybe redirect to setup or show a message
         return redirect(url_for('setup_page')) 
+
+    if len(participants) >= ATTENDANCE_FORM_CACHE_MIN_PARTICIPANTS:
+        form_html = _render_attendance_form(tuple((p['id'], p['name']) for p in participants))
+        return form_html.replace(_SESSION_DATE_PLACEHOLDER, str(escape(session_date)))
         
     return render_template('mark_attendance.html', participants=participants, session_date=session_date)
 
+@functools.lru_cache(maxsize=1)
+def _render_attendance_form(roster):
+    """Renders the attendance form for a roster of (id, name) pairs with a placeholder session date.
+
+    Keyed on the roster itself, so any change to it (made by this process or not)
+    produces a fresh render once get_all_participants() sees the change.
+    """
+    participants = [{'id': participant_id, 'name': name} for participant_id, name in roster]
+    return render_template('mark_attendance.html', participants=participants,
+                           session_date=_SESSION_DATE_PLACEHOLDER)
+
 @app.route('/view', methods=['GET'])
 def view_attendance_page():
     session_date_to_view = request.args.get('session_date_view')
-    attendance_records = []
 
     if session_date_to_view:
-        attendance_records = get_attendance_for_session(session_date_to_view)
-        
+        # Stream the rendered page to the client as the template produces it
+        return Response(stream_template('view_attendance.html',
+                                        attendance_records=get_attendance_for_session(session_date_to_view),
+                                        session_date=session_date_to_view))
+
     # session_date is used to display the title like "Attendance for Session: {{ session_date }}"
     # request.args.get('session_date_view') ensures the form can repopulate and data is fetched for that date
     return render_template('view_attendance.html',
-                           attendance_records=attendance_records,
+                           attendance_records=[],
                            session_date=session_date_to_view) # Removed request=request, not strictly needed if using session_date_to_view for display
 
 if __name__ == '__main__':
-    # Initialize the database when app.py is run directly
-    # In a production environment, you might want a separate script or command for this.
-    init_db() 
-    app.run(debug=True, host='0.0.0.0', port=8080) # Added host and port
+    # Create the database first with `flask --app app init-db`.
+    # Threaded so concurrent requests overlap; pooled connections are shared across threads.
+    # For production use a WSGI server instead, e.g. `waitress-serve --threads=8 app:app`.
+    app.run(threaded=True, host='0.0.0.0', port=8080) # Added host and port
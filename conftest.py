@@ -0,0 +1,4 @@
+import os
+
+# Set before the test modules import app, which reads it at import time
+os.environ.setdefault("APP_SECRET_KEY", "test_secret_key")
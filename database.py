@@ -1,16 +1,172 @@
+import os
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
+
+try:
+    import apsw  # Optional: thinner SQLite wrapper used for bulk writes when enabled
+except ImportError:
+    apsw = None
 
 DATABASE_NAME = "attendance.db"
+POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", 5))
+if POOL_SIZE < 1:
+    # A LifoQueue with maxsize 0 is unbounded and the pool would never open a connection
+    raise ValueError(f"SQLITE_POOL_SIZE must be at least 1, got {POOL_SIZE}")
+# Opt-in with SQLITE_USE_APSW=1; stays off (plain sqlite3) when apsw isn't installed.
+# apsw builds that bundle their own SQLite (the default pip wheels) are refused: two
+# SQLite copies opening the same file in one process clobber each other's locks.
+USE_APSW = False
+if os.environ.get("SQLITE_USE_APSW") == "1":
+    if apsw is None:
+        print("Warning: SQLITE_USE_APSW=1 but apsw is not installed; using sqlite3.")
+    elif apsw.using_amalgamation:
+        print("Warning: SQLITE_USE_APSW=1 ignored: this apsw build bundles its own SQLite "
+              "and would corrupt locking with sqlite3; using sqlite3.")
+    else:
+        USE_APSW = True
+
+# Idle pooled connections, most recently returned first so hot connections
+# (and their statement caches) get reused.
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+_pool_lock = threading.Lock()
+_pool_created = 0
+_pool_generation = 0
+
+# SQLite allows only one writer at a time, so a single shared apsw connection
+# behind a lock costs no write concurrency.
+_apsw_conn = None
+_apsw_lock = threading.Lock()
+
+# Applied to every connection the app uses; journal_mode=WAL is persistent
+# in the database file, the rest are per-connection settings.
+_PRAGMAS = (
+    # First, so the journal_mode switch below already waits for a competing lock.
+    # sqlite3.connect() installs the same 5 s busy handler by default (timeout=5.0);
+    # this matters for apsw connections, which have none.
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",  # 20 MB
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA foreign_keys=ON",
+)
+
+def _apply_pragmas(conn):
+    """Configures journaling, caching and constraint checks on a connection."""
+    for pragma in _PRAGMAS:
+        conn.execute(pragma)
 
 def get_db_connection():
     """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DATABASE_NAME)
+    # uri=True so DATABASE_NAME may also be a file: URI, e.g. a shared in-memory database
+    conn = sqlite3.connect(DATABASE_NAME, uri=True)
     conn.row_factory = sqlite3.Row  # Allows accessing columns by name
     return conn
 
+def _new_pooled_connection():
+    """Opens a connection suitable for sharing between request threads."""
+    conn = sqlite3.connect(DATABASE_NAME, uri=True, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    _apply_pragmas(conn)
+    return conn
+
+@contextmanager
+def borrow_conn():
+    """Borrows a connection from the pool and returns it when the block exits.
+
+    The pool grows lazily up to POOL_SIZE connections; once that many are in
+    use, callers wait for one to be returned. Any open transaction is rolled
+    back if the block raises.
+    """
+    global _pool_created
+    try:
+        generation, conn = _pool.get_nowait()
+    except queue.Empty:
+        with _pool_lock:
+            generation = _pool_generation
+            grow = _pool_created < POOL_SIZE
+            if grow:
+                _pool_created += 1
+        if grow:
+            try:
+                conn = _new_pooled_connection()
+            except Exception:
+                with _pool_lock:
+                    _pool_created -= 1
+                raise
+        else:
+            generation, conn = _pool.get()
+
+    try:
+        yield conn
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        with _pool_lock:
+            stale = generation != _pool_generation
+        if stale:
+            # The pool was reset while this connection was out (e.g. by init_db)
+            conn.close()
+        else:
+            _pool.put((generation, conn))
+
+def _apsw_connection():
+    """Returns the shared apsw write connection, opening it on first use. Call with _apsw_lock held."""
+    global _apsw_conn
+    if _apsw_conn is None:
+        flags = apsw.SQLITE_OPEN_READWRITE | apsw.SQLITE_OPEN_CREATE | apsw.SQLITE_OPEN_URI
+        _apsw_conn = apsw.Connection(DATABASE_NAME, flags=flags)
+        cursor = _apsw_conn.cursor()
+        for pragma in _PRAGMAS:
+            cursor.execute(pragma)
+    return _apsw_conn
+
+def executemany_in_transaction(sql, rows):
+    """Runs sql once for each row of parameters inside a single transaction."""
+    if USE_APSW:
+        with _apsw_lock:
+            conn = _apsw_connection()
+            try:
+                with conn:  # Commits on success, rolls back on error
+                    conn.cursor().executemany(sql, rows)
+            except apsw.ConstraintError as e:
+                # Surface constraint failures the same way as the sqlite3 path
+                raise sqlite3.IntegrityError(str(e)) from e
+        return
+
+    with borrow_conn() as conn:
+        conn.execute("BEGIN")
+        conn.executemany(sql, rows)
+        conn.commit()
+
+def close_pool():
+    """Closes all idle pooled connections and discards any still borrowed."""
+    global _pool_created, _pool_generation, _apsw_conn
+    with _pool_lock:
+        _pool_generation += 1
+        _pool_created = 0
+        while True:
+            try:
+                _, conn = _pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+    with _apsw_lock:
+        if _apsw_conn is not None:
+            _apsw_conn.close()
+            _apsw_conn = None
+
 def init_db():
     """Initializes the database and creates tables if they don't exist."""
+    # Pooled connections may point at a previous database file
+    close_pool()
     conn = get_db_connection()
+    _apply_pragmas(conn)
     cursor = conn.cursor()
 
     # Create participants table
@@ -33,6 +189,15 @@ def init_db():
         )
     """)
 
+    # One record per participant per date; also the UPSERT conflict target.
+    # An index rather than a table constraint so existing databases pick it up.
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_ar_pid_date
+        ON attendance_records (participant_id, session_date)
+    """)
+    # Lookups of a session's records by date
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ar_session_date ON attendance_records (session_date)")
+
     conn.commit()
     conn.close()
     print("Database initialized successfully.")
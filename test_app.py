@@ -1,43 +1,42 @@
 import pytest
-import os
 from flask import session
 from app import app as flask_app  # Renamed to avoid conflict with pytest 'app' fixture
 from database import init_db, get_db_connection, DATABASE_NAME as ORIGINAL_DATABASE_NAME
-from app import add_participant # To help setup tests
+from app import add_participant, clear_caches # To help setup tests
 
-# Use a temporary database for testing
-TEST_DB_NAME = "test_app_attendance.db"
+# Use a named in-memory database for testing; it lives as long as a connection to it is open
+TEST_DB_NAME = "file:test_app?mode=memory&cache=shared"
 
 @pytest.fixture(scope='module')
-def app():
-    """Fixture to configure the Flask app for testing."""
+def database_connection():
+    """Fixture to create the test database once for the whole module."""
     # Override the database name before app context is created
     import database
     database.DATABASE_NAME = TEST_DB_NAME
-    
-    flask_app.config.update({
-        "TESTING": True,
-        "DATABASE": TEST_DB_NAME,
-        "SECRET_KEY": "test_secret_key", # Important for session testing
-        "WTF_CSRF_ENABLED": False # Disable CSRF for easier testing if you were using Flask-WTF
-    })
-    
-    # Ensure a clean state by deleting the test DB if it exists
-    if os.path.exists(TEST_DB_NAME):
-        os.remove(TEST_DB_NAME)
-    
+
+    # This connection keeps the in-memory database alive between tests
+    conn = get_db_connection()
     with flask_app.app_context():
         init_db()
 
-    yield flask_app
+    yield conn
+
+    database.close_pool()
+    conn.close()
 
-    # Teardown: clean up the database file after all tests in the module
-    if os.path.exists(TEST_DB_NAME):
-        os.remove(TEST_DB_NAME)
-    
     # Restore the original database name
     database.DATABASE_NAME = ORIGINAL_DATABASE_NAME
 
+@pytest.fixture(scope='module')
+def app(database_connection):
+    """Fixture to configure the Flask app for testing."""
+    flask_app.config.update({
+        "TESTING": True,
+        "DATABASE": TEST_DB_NAME,
+        "WTF_CSRF_ENABLED": False # Disable CSRF for easier testing if you were using Flask-WTF
+    })
+    return flask_app
+
 
 @pytest.fixture
 def client(app):
@@ -45,15 +44,25 @@ def client(app):
     return app.test_client()
 
 @pytest.fixture(autouse=True) # Automatically use this for each test function
-def setup_clean_db_for_test(app):
-    """Ensures each test starts with a clean database by re-initializing."""
-    # app fixture already sets TEST_DB_NAME
-    if os.path.exists(TEST_DB_NAME):
-        os.remove(TEST_DB_NAME)
-    with app.app_context():
-        init_db()
+def setup_clean_db_for_test(database_connection):
+    """Ensures each test starts with empty tables and caches."""
+    database_connection.execute("DELETE FROM attendance_records")
+    database_connection.execute("DELETE FROM participants")
+    database_connection.execute("DELETE FROM sqlite_sequence")
+    database_connection.commit()
+    clear_caches()
     yield # Test runs here
 
+def test_secret_key_from_environment(app):
+    """Test the secret key comes from APP_SECRET_KEY (set in conftest.py)."""
+    assert app.secret_key == "test_secret_key"
+
+def test_init_db_command(app):
+    """Test `flask init-db` initializes the database."""
+    result = app.test_cli_runner().invoke(args=["init-db"])
+    assert result.exit_code == 0
+    assert "Database initialized successfully." in result.output
+
 # --- Test Setup Page (/) ---
 def test_setup_page_get(client):
     """Test GET / returns HTTP 200."""
@@ -67,9 +76,9 @@ def test_setup_page_add_participant(client):
         'participant_name': 'Test User',
         'action': 'add_participant',
         'session_date': '2024-01-10' # Include session_date as setup.html expects it
-    }, follow_redirects=True) # follow_redirects to check final page content
+    })
     
-    assert response.status_code == 200 # After redirect
+    assert response.status_code == 200 # Page is rendered directly, no redirect
     assert b"Test User" in response.data # Check if participant is listed
 
     conn = get_db_connection() # Uses TEST_DB_NAME due to fixture
@@ -79,6 +88,21 @@ def test_setup_page_add_participant(client):
     conn.close()
     assert participant is not None
 
+def test_setup_page_paginates_participants(client, monkeypatch):
+    """Test GET /?page=N shows one page of participants with navigation links."""
+    import app as app_module
+    monkeypatch.setattr(app_module, "PARTICIPANTS_PAGE_SIZE", 1)
+    add_participant("Page One")
+    add_participant("Page Two")
+
+    response = client.get('/')
+    assert b"Page One" in response.data and b"Page Two" not in response.data
+    assert b'href="/?page=1"' in response.data
+
+    response = client.get('/?page=1')
+    assert b"Page Two" in response.data and b"Page One" not in response.data
+    assert b'href="/?page=0"' in response.data
+
 def test_setup_page_proceed_to_attendance(client):
     """Test POST / with action='proceed_to_attendance'."""
     test_date = "2024-03-01"
@@ -108,6 +132,40 @@ def test_attendance_page_get_with_session_date(client):
     assert b"Mark Attendance" in response.data
     assert b"Session Date: 2024-03-02" in response.data
 
+def test_attendance_page_get_cached_form(client, monkeypatch):
+    """Test GET /attendance serves the cached form with the current session date and roster."""
+    import app as app_module
+    monkeypatch.setattr(app_module, "ATTENDANCE_FORM_CACHE_MIN_PARTICIPANTS", 1)
+    add_participant("Cached Tester")
+
+    with client.session_transaction() as sess:
+        sess['session_date'] = "2024-03-06"
+    response = client.get('/attendance')
+    assert b"Session Date: 2024-03-06" in response.data
+    assert b"Cached Tester" in response.data
+
+    add_participant("Late Joiner")
+    with client.session_transaction() as sess:
+        sess['session_date'] = "<2024-03-07>"
+    response = client.get('/attendance')
+    assert b"Session Date: &lt;2024-03-07&gt;" in response.data
+    assert b"Late Joiner" in response.data
+
+def test_attendance_page_cached_form_sees_external_roster_changes(client, monkeypatch, database_connection):
+    """Test the cached form picks up participants added outside this process once the roster cache expires."""
+    import app as app_module
+    monkeypatch.setattr(app_module, "ATTENDANCE_FORM_CACHE_MIN_PARTICIPANTS", 1)
+    monkeypatch.setattr(app_module, "PARTICIPANTS_CACHE_TTL", 0)
+    add_participant("Alice")
+
+    with client.session_transaction() as sess:
+        sess['session_date'] = "2024-03-08"
+    assert b"Alice" in client.get('/attendance').data
+
+    database_connection.execute("INSERT INTO participants (name) VALUES ('Bob')")
+    database_connection.commit()
+    assert b"Bob" in client.get('/attendance').data
+
 def test_attendance_page_get_no_session_date(client):
     """Test GET /attendance when session_date is NOT in session (should redirect to setup)."""
     response = client.get('/attendance')
@@ -152,6 +210,26 @@ def test_attendance_page_post_submit_attendance(client, app): # Changed app_cont
     assert records[0]['name'] == "Participant One" and records[0]['status'] == 'Present'
     assert records[1]['name'] == "Participant Two" and records[1]['status'] == 'Absent'
 
+def test_attendance_page_post_invalid_row_saves_nothing(client, app, database_connection):
+    """Test POST /attendance reports an error instead of redirecting when the batch is rejected."""
+    session_date = "2024-03-09"
+    p1 = add_participant("Valid Participant")
+
+    with client.session_transaction() as sess:
+        sess['session_date'] = session_date
+
+    response = client.post('/attendance', data={
+        f'status_{p1}': 'Present',
+        'status_99999': 'Present', # Unknown participant
+        'session_date': session_date
+    })
+
+    assert response.status_code == 400
+    assert b"Attendance could not be saved" in response.data
+    count = database_connection.execute(
+        "SELECT COUNT(*) FROM attendance_records WHERE session_date = ?", (session_date,)).fetchone()[0]
+    assert count == 0
+
 # --- Test View Page (/view) ---
 def test_view_page_get_with_data(client, app): # Changed app_context to app
     """Test GET /view?session_date_view=YYYY-MM-DD with data."""
@@ -166,6 +244,7 @@ def test_view_page_get_with_data(client, app): # Changed app_context to app
 
     response = client.get(f'/view?session_date_view={session_date}')
     assert response.status_code == 200
+    assert response.is_streamed
     assert b"View Attendance" in response.data
     assert f"Attendance for Session: {session_date}".encode('utf-8') in response.data
     assert b"View Tester" in response.data
@@ -1,35 +1,41 @@
 import pytest
 import sqlite3
-import os
+import database
 from database import init_db, get_db_connection, DATABASE_NAME as ORIGINAL_DATABASE_NAME
-from app import add_participant, get_all_participants, record_attendance, get_attendance_for_session
+from app import _SQL_GET_ATTENDANCE_FOR_SESSION, _attendance_cache, clear_caches, add_participant, get_all_participants, record_attendance, batch_record_attendance, get_attendance_for_session
 
-# Use a temporary database for testing
-TEST_DB_NAME = "test_attendance.db"
+# Use a named in-memory database for testing; it lives as long as a connection to it is open
+TEST_DB_NAME = "file:test_backend?mode=memory&cache=shared"
 
-@pytest.fixture(autouse=True)
-def setup_and_teardown_database():
-    """Fixture to set up a clean database for each test and tear it down afterwards."""
+@pytest.fixture(scope='module')
+def database_connection():
+    """Fixture to create the test database once for the whole module."""
     # Override the original database name with the test database name
-    import database
     database.DATABASE_NAME = TEST_DB_NAME
-    
-    # Ensure a clean state by deleting the test DB if it exists
-    if os.path.exists(TEST_DB_NAME):
-        os.remove(TEST_DB_NAME)
-    
-    # Initialize the database and tables
+
+    # This connection keeps the in-memory database alive between tests
+    conn = get_db_connection()
     init_db()
-    
-    yield # This is where the testing happens
 
-    # Teardown: clean up the database file after tests
-    if os.path.exists(TEST_DB_NAME):
-        os.remove(TEST_DB_NAME)
-    
+    yield conn
+
+    database.close_pool()
+    conn.close()
+
     # Restore the original database name
     database.DATABASE_NAME = ORIGINAL_DATABASE_NAME
 
+@pytest.fixture(autouse=True)
+def setup_and_teardown_database(database_connection):
+    """Fixture to give each test empty tables and caches."""
+    database_connection.execute("DELETE FROM attendance_records")
+    database_connection.execute("DELETE FROM participants")
+    database_connection.execute("DELETE FROM sqlite_sequence")
+    database_connection.commit()
+    clear_caches()
+
+    yield # This is where the testing happens
+
 # --- Test database connection ---
 def test_get_db_connection():
     conn = get_db_connection()
@@ -72,6 +78,27 @@ def test_get_all_participants_with_data():
     assert "Charlie Brown" in participant_names
     assert "Daisy Duck" in participant_names
 
+def test_get_all_participants_paginated():
+    for name in ("Zed", "Amy", "Mia"):
+        add_participant(name)
+    assert [p["name"] for p in get_all_participants(limit=2)] == ["Amy", "Mia"]
+    assert [p["name"] for p in get_all_participants(limit=2, offset=2)] == ["Zed"]
+
+def test_get_all_participants_cache_is_bounded(monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, "PARTICIPANTS_CACHE_MAX_PAGES", 2)
+
+    for page in range(5):
+        get_all_participants(limit=10, offset=page * 10)
+
+    assert list(app_module._participants_cache['pages']) == [(10, 30), (10, 40)]
+
+def test_get_all_participants_cache_invalidated_by_add():
+    assert len(get_all_participants()) == 0 # Populates the cache
+    add_participant("Lara Croft")
+    participants = get_all_participants()
+    assert [p["name"] for p in participants] == ["Lara Croft"]
+
 # --- Test attendance functions ---
 def test_record_attendance_new():
     participant_id = add_participant("Eve Harrington")
@@ -119,6 +146,56 @@ def test_record_attendance_update():
     assert record is not None
     assert record["status"] == updated_status
 
+def test_record_attendance_invalid_status():
+    participant_id = add_participant("Ned Flanders")
+    assert record_attendance(participant_id, "2024-01-09", "Late") is False
+
+def test_batch_record_attendance_inserts_and_updates():
+    p1_id = add_participant("Jane Eyre")
+    p2_id = add_participant("Kermit Frog")
+    session_date = "2024-01-06"
+    record_attendance(p1_id, session_date, "Absent")
+
+    success = batch_record_attendance([
+        (p1_id, session_date, "Present"),
+        (p2_id, session_date, "Absent"),
+    ])
+    assert success is True
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT participant_id, status FROM attendance_records
+        WHERE session_date = ? ORDER BY participant_id
+    """, (session_date,))
+    records = cursor.fetchall()
+    conn.close()
+
+    assert [(r["participant_id"], r["status"]) for r in records] == [(p1_id, "Present"), (p2_id, "Absent")]
+
+@pytest.mark.skipif(database.apsw is None or database.apsw.using_amalgamation,
+                    reason="needs apsw linked against the same SQLite as sqlite3")
+def test_batch_record_attendance_through_apsw(monkeypatch, tmp_path):
+    # apsw and sqlite3 only share the in-memory test database if they share a library,
+    # so use a file to keep this test independent of how the fixture database is opened
+    monkeypatch.setattr(database, "USE_APSW", True)
+    monkeypatch.setattr(database, "DATABASE_NAME", str(tmp_path / "apsw.db"))
+    init_db()
+    clear_caches()
+    try:
+        p1_id = add_participant("Quinn")
+        p2_id = add_participant("Rory")
+        session_date = "2024-01-11"
+        assert batch_record_attendance([(p1_id, session_date, "Present"), (p2_id, session_date, "Absent")]) is True
+        # A constraint failure rolls back the whole batch
+        assert batch_record_attendance([(p1_id, session_date, "Absent"), (p2_id, session_date, "Late")]) is False
+
+        records = get_attendance_for_session(session_date)
+        assert [(r["participant_name"], r["status"]) for r in records] == [("Quinn", "Present"), ("Rory", "Absent")]
+    finally:
+        database.close_pool()
+        clear_caches()
+
 def test_get_attendance_for_session_with_data():
     p1_id = add_participant("Grace Hopper")
     p2_id = add_participant("Harry Potter")
@@ -139,6 +216,45 @@ def test_get_attendance_for_session_with_data():
     assert harry_record is not None
     assert harry_record["status"] == "Absent"
 
+def test_get_attendance_for_session_cache_invalidated_by_record():
+    participant_id = add_participant("Mary Poppins")
+    session_date = "2024-01-07"
+    record_attendance(participant_id, session_date, "Present")
+    assert get_attendance_for_session(session_date)[0]["status"] == "Present" # Populates the cache
+
+    record_attendance(participant_id, session_date, "Absent")
+    assert get_attendance_for_session(session_date)[0]["status"] == "Absent"
+
+def test_get_attendance_for_session_query_plan_uses_date_index():
+    conn = get_db_connection()
+    plan = [row["detail"] for row in conn.execute("EXPLAIN QUERY PLAN " + _SQL_GET_ATTENDANCE_FOR_SESSION, ("2024-01-08",))]
+    conn.close()
+
+    assert any("idx_ar_session_date" in step for step in plan)
+
+def test_get_attendance_for_session_past_date_cache_expires(monkeypatch, database_connection):
+    import app as app_module
+    participant_id = add_participant("Paul Atreides")
+    session_date = "2020-01-01"
+    record_attendance(participant_id, session_date, "Present")
+    assert get_attendance_for_session(session_date)[0]["status"] == "Present" # Populates the cache
+
+    # Another worker changes the record; this process only notices once the entry expires
+    database_connection.execute("UPDATE attendance_records SET status = 'Absent' WHERE session_date = ?", (session_date,))
+    database_connection.commit()
+    monkeypatch.setattr(app_module, "ATTENDANCE_PAST_CACHE_TTL", 0)
+    assert get_attendance_for_session(session_date)[0]["status"] == "Absent"
+
+def test_get_attendance_for_session_cache_is_bounded(monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, "ATTENDANCE_CACHE_MAX_ENTRIES", 2)
+
+    for session_date in ("0", "1x", "2023-01-01", "2023-01-02", "2023-01-03"):
+        assert get_attendance_for_session(session_date) == []
+
+    # Non-dates are never cached and only the newest dates are kept
+    assert list(_attendance_cache) == ["2023-01-02", "2023-01-03"]
+
 def test_get_attendance_for_session_no_records_for_date():
     add_participant("Isolated Person") # Add a participant
     # Do not record any attendance for this person or for the target date